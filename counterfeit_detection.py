@@ -1,18 +1,54 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from supabase import create_client, Client
-import Levenshtein
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
 
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+# Credentials normally come from the parent process (listener.js loads .env and the
+# bridge inherits its environment), so .env is only parsed when they are missing
+if not (os.environ.get("SUPABASE_URL") and os.environ.get("SUPABASE_SERVICE_KEY")):
+    load_dotenv()
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
 
-def fetch_table_from_supabase(table_name):
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-    response = supabase.table(table_name).select("*").execute()
+# counterfeit_type categories, indexed by the counterfeit_match flag
+COUNTERFEIT_TYPES = ['unknown', 'counterfeit']
+
+_supabase_client = None
+# The reference tables are fetched from concurrent threads, so the shared client is
+# built under a lock; otherwise the first fetches could each build their own client
+_supabase_client_lock = threading.Lock()
+
+def get_supabase_client() -> Client:
+    """Create the Supabase client once and reuse its HTTP session across fetches."""
+    global _supabase_client
+    with _supabase_client_lock:
+        if _supabase_client is None:
+            client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+            # supabase-py builds the PostgREST client (which owns the httpx session and
+            # connection pool) lazily on first .table() use, without locking, so build
+            # it here while still holding the lock
+            client.postgrest
+            _supabase_client = client
+        return _supabase_client
+
+def fetch_table_from_supabase(table_name, columns="*"):
+    response = get_supabase_client().table(table_name).select(columns).execute()
     return pd.DataFrame(response.data)
 
+def _lowercase_column(column):
+    """
+    Lowercase a symbol/name column once per comparison.
+    Returns the lowercased strings and a boolean mask of empty values.
+    """
+    values = column.map(str).str.lower().tolist()
+    empty = np.fromiter((not v for v in values), dtype=bool, count=len(values))
+    return values, empty
+
 def compare_dataframes_with_levenshtein(token_df, reference_df, symbol_threshold=0.75, name_threshold=0.75):
     """
     Compare token_df with reference_df using Levenshtein similarity.
@@ -24,64 +60,71 @@ def compare_dataframes_with_levenshtein(token_df, reference_df, symbol_threshold
     - symbol_threshold: Minimum similarity threshold for symbol (default 0.75)
     - name_threshold: Minimum similarity threshold for name (default 0.75)
     """
-    result_data = []
-    
-    for idx, token_row in token_df.iterrows():
-        token_symbol = str(token_row['symbol']).lower()
-        token_name = str(token_row['name']).lower()
-        best_match = None
-        best_combined_score = 0
-        for _, ref_row in reference_df.iterrows():
-            ref_symbol = str(ref_row['symbol']).lower()
-            ref_name = str(ref_row['name']).lower()
-            if token_symbol and ref_symbol:
-                max_symbol_len = max(len(token_symbol), len(ref_symbol))
-                symbol_distance = Levenshtein.distance(token_symbol, ref_symbol)
-                symbol_similarity = 1 - (symbol_distance / max_symbol_len if max_symbol_len > 0 else 0)
-            else:
-                symbol_similarity = 0
-            if token_name and ref_name:
-                max_name_len = max(len(token_name), len(ref_name))
-                name_distance = Levenshtein.distance(token_name, ref_name)
-                name_similarity = 1 - (name_distance / max_name_len if max_name_len > 0 else 0)
-            else:
-                name_similarity = 0
-            combined_score = (symbol_similarity * 0.6) + (name_similarity * 0.4)
-            if combined_score > best_combined_score:
-                best_combined_score = combined_score
-                best_match = {
-                    'ref_symbol': ref_row['symbol'],
-                    'ref_name': ref_row['name'],
-                    'symbol_similarity': symbol_similarity,
-                    'name_similarity': name_similarity,
-                    'combined_score': combined_score
-                }
-        result_row = token_row.to_dict()
-        if best_match:
-            # Check if both symbol and name meet the similarity thresholds
-            is_match = (best_match['symbol_similarity'] >= symbol_threshold and 
-                        best_match['name_similarity'] >= name_threshold)
-            
-            result_row.update({
-                'match_symbol': best_match['ref_symbol'],
-                'match_name': best_match['ref_name'],
-                'symbol_similarity': best_match['symbol_similarity'],
-                'name_similarity': best_match['name_similarity'],
-                'combined_score': best_match['combined_score'],
-                'is_match': is_match
-            })
-        else:
-            result_row.update({
-                'match_symbol': '',
-                'match_name': '',
-                'symbol_similarity': 0.0,
-                'name_similarity': 0.0,
-                'combined_score': 0.0,
-                'is_match': False
-            })
-        result_data.append(result_row)
-    all_results_df = pd.DataFrame(result_data)
-    matched_df = all_results_df[all_results_df['is_match'] == True].copy()
+    # An empty Supabase table comes back without any columns, so check before indexing
+    required = {'symbol', 'name'}
+    if (token_df.empty or reference_df.empty
+            or not required.issubset(token_df.columns) or not required.issubset(reference_df.columns)):
+        return token_df.iloc[0:0].assign(
+            match_symbol='', match_name='', symbol_similarity=0.0,
+            name_similarity=0.0, combined_score=0.0, is_match=False
+        )
+    tok_syms, tok_sym_empty = _lowercase_column(token_df['symbol'])
+    tok_names, tok_name_empty = _lowercase_column(token_df['name'])
+    ref_syms, ref_sym_empty = _lowercase_column(reference_df['symbol'])
+    ref_names, ref_name_empty = _lowercase_column(reference_df['name'])
+
+    # A match needs a combined score of at least min_combined, which in turn needs
+    # each field above a floor; pairs below it can never be the matching best ref,
+    # so their DP is cut short (score reported as 0)
+    min_combined = (symbol_threshold * 0.6) + (name_threshold * 0.4)
+    symbol_cutoff = max((min_combined - 0.4) / 0.6, 0)
+    name_cutoff = max((min_combined - 0.6) / 0.4, 0)
+
+    # Full N x M symbol similarity matrix, computed in C across all cores.
+    # With a cutoff, pairs whose length difference alone exceeds the allowed
+    # edit distance are rejected before any DP is run.
+    sym_sim = process.cdist(tok_syms, ref_syms, scorer=Levenshtein.normalized_similarity,
+                            score_cutoff=symbol_cutoff, dtype=np.float64, workers=-1)
+    # An empty symbol/name never contributes to the similarity
+    sym_sim[tok_sym_empty, :] = 0
+    sym_sim[:, ref_sym_empty] = 0
+
+    if symbol_cutoff > 0:
+        # Only pairs whose symbol survived the cutoff can be a match, so the
+        # (longer) names are only compared for those candidates
+        cand_rows, cand_cols = np.nonzero(sym_sim)
+        name_sim = np.zeros_like(sym_sim)
+        name_sim[cand_rows, cand_cols] = process.cpdist(
+            np.asarray(tok_names, dtype=object)[cand_rows].tolist(),
+            np.asarray(ref_names, dtype=object)[cand_cols].tolist(),
+            scorer=Levenshtein.normalized_similarity, score_cutoff=name_cutoff, dtype=np.float64, workers=-1
+        )
+    else:
+        name_sim = process.cdist(tok_names, ref_names, scorer=Levenshtein.normalized_similarity,
+                                 score_cutoff=name_cutoff, dtype=np.float64, workers=-1)
+    name_sim[tok_name_empty, :] = 0
+    name_sim[:, ref_name_empty] = 0
+
+    combined = (sym_sim * 0.6) + (name_sim * 0.4)
+    best_idx = combined.argmax(axis=1)
+    rows = np.arange(len(tok_syms))
+    best_sym_sim = sym_sim[rows, best_idx]
+    best_name_sim = name_sim[rows, best_idx]
+    best_combined = combined[rows, best_idx]
+    # Check if both symbol and name meet the similarity thresholds
+    # (a best combined score of 0 means no reference was similar at all)
+    is_match = (best_combined > 0) & (best_sym_sim >= symbol_threshold) & (best_name_sim >= name_threshold)
+
+    # Results keep token_df's index so callers can align matches back to their rows
+    all_results_df = token_df.assign(
+        match_symbol=reference_df['symbol'].to_numpy()[best_idx],
+        match_name=reference_df['name'].to_numpy()[best_idx],
+        symbol_similarity=best_sym_sim,
+        name_similarity=best_name_sim,
+        combined_score=best_combined,
+        is_match=is_match
+    )
+    matched_df = all_results_df[is_match].copy()
     return matched_df
 
 def assess_token_counterfeit(token_df):
@@ -89,19 +132,38 @@ def assess_token_counterfeit(token_df):
     Assess if tokens are counterfeit or repeat scams by comparing against safe_tokens and fake_directory.
     Returns DataFrame with match details and assigned types.
     """
-    safe_tokens = fetch_table_from_supabase("safe_tokens")
-    fake_directory = fetch_table_from_supabase("fake_directory")
+    # Both reference fetches are I/O-bound, so run them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        safe_tokens, fake_directory = executor.map(
+            lambda table: fetch_table_from_supabase(table, columns="name,symbol"),
+            ["safe_tokens", "fake_directory"]
+        )
     
-    # Extract only the name and symbol columns from fake_directory
+    # Extract only the name and symbol columns from both reference tables
+    # (reindex, since an empty table comes back without any columns)
     # Use drop_duplicates to keep only unique combinations while preserving column names
-    fake_pairs = fake_directory[['name', 'symbol']].drop_duplicates().copy()
+    safe_pairs = safe_tokens.reindex(columns=['name', 'symbol']).drop_duplicates()
+    fake_pairs = fake_directory.reindex(columns=['name', 'symbol']).drop_duplicates().copy()
     
-    safe_matches = compare_dataframes_with_levenshtein(token_df, safe_tokens)
-    fake_matches = compare_dataframes_with_levenshtein(token_df, fake_pairs)
-    token_df = token_df.copy()
-    token_df['counterfeit_type'] = 'unknown'
+    # Copy-cat tokens repeat the same name/symbol, so compare each pair only once.
+    # Pairs are keyed by their str() form, which is all the comparison looks at and
+    # also works for unhashable values (e.g. lists)
+    pair_keys = pd.DataFrame({
+        'name': token_df['name'].map(str),
+        'symbol': token_df['symbol'].map(str)
+    })
+    unique_pairs = pair_keys.drop_duplicates().reset_index(drop=True)
+    safe_matches = compare_dataframes_with_levenshtein(unique_pairs, safe_pairs)
+    fake_matches = compare_dataframes_with_levenshtein(unique_pairs, fake_pairs)
     # If a token matches either safe or fake, mark as 'counterfeit'
-    is_counterfeit = token_df.index.isin(safe_matches.index) | token_df.index.isin(fake_matches.index)
-    token_df.loc[is_counterfeit, 'counterfeit_type'] = 'counterfeit'
+    unique_pairs['counterfeit_match'] = (unique_pairs.index.isin(safe_matches.index) |
+                                         unique_pairs.index.isin(fake_matches.index))
+    is_counterfeit = pair_keys.merge(
+        unique_pairs, on=['name', 'symbol'], how='left'
+    )['counterfeit_match'].to_numpy(dtype=bool)
+    token_df = token_df.copy()
+    token_df['counterfeit_type'] = pd.Categorical.from_codes(
+        is_counterfeit.astype(np.int8), categories=COUNTERFEIT_TYPES
+    )
     token_df['counterfeit_match'] = is_counterfeit
     return token_df
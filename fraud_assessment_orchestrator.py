@@ -1,8 +1,10 @@
 import os
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from supabase import create_client, Client
-import Levenshtein
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
 from fraud_detection import check_phishing_indicators
 
 load_dotenv()
@@ -14,65 +16,84 @@ def fetch_table_from_supabase(table_name):
     response = supabase.table(table_name).select("*").execute()
     return pd.DataFrame(response.data)
 
+def _lowercase_column(column):
+    """
+    Lowercase a symbol/name column once per comparison.
+    Returns the lowercased strings and a boolean mask of empty values.
+    """
+    values = column.map(str).str.lower().tolist()
+    empty = np.fromiter((not v for v in values), dtype=bool, count=len(values))
+    return values, empty
+
 def compare_dataframes_with_levenshtein(token_df, reference_df, symbol_threshold=0.75, name_threshold=0.75):
     """
     Compare token_df with reference_df using Levenshtein similarity.
     Returns a DataFrame of matches with similarity scores.
     """
-    result_data = []
-    for idx, token_row in token_df.iterrows():
-        token_symbol = str(token_row['symbol']).lower()
-        token_name = str(token_row['name']).lower()
-        best_match = None
-        best_combined_score = 0
-        for _, ref_row in reference_df.iterrows():
-            ref_symbol = str(ref_row['symbol']).lower()
-            ref_name = str(ref_row['name']).lower()
-            # Levenshtein similarity
-            if token_symbol and ref_symbol:
-                max_symbol_len = max(len(token_symbol), len(ref_symbol))
-                symbol_distance = Levenshtein.distance(token_symbol, ref_symbol)
-                symbol_similarity = 1 - (symbol_distance / max_symbol_len if max_symbol_len > 0 else 0)
-            else:
-                symbol_similarity = 0
-            if token_name and ref_name:
-                max_name_len = max(len(token_name), len(ref_name))
-                name_distance = Levenshtein.distance(token_name, ref_name)
-                name_similarity = 1 - (name_distance / max_name_len if max_name_len > 0 else 0)
-            else:
-                name_similarity = 0
-            combined_score = (symbol_similarity * 0.6) + (name_similarity * 0.4)
-            if combined_score > best_combined_score:
-                best_combined_score = combined_score
-                best_match = {
-                    'ref_symbol': ref_row['symbol'],
-                    'ref_name': ref_row['name'],
-                    'symbol_similarity': symbol_similarity,
-                    'name_similarity': name_similarity,
-                    'combined_score': combined_score
-                }
-        result_row = token_row.to_dict()
-        if best_match:
-            result_row.update({
-                'match_symbol': best_match['ref_symbol'],
-                'match_name': best_match['ref_name'],
-                'symbol_similarity': best_match['symbol_similarity'],
-                'name_similarity': best_match['name_similarity'],
-                'combined_score': best_match['combined_score'],
-                'is_match': (best_match['symbol_similarity'] >= symbol_threshold and best_match['name_similarity'] >= name_threshold)
-            })
-        else:
-            result_row.update({
-                'match_symbol': '',
-                'match_name': '',
-                'symbol_similarity': 0.0,
-                'name_similarity': 0.0,
-                'combined_score': 0.0,
-                'is_match': False
-            })
-        result_data.append(result_row)
-    all_results_df = pd.DataFrame(result_data)
-    matched_df = all_results_df[all_results_df['is_match'] == True].copy()
+    # An empty Supabase table comes back without any columns, so check before indexing
+    required = {'symbol', 'name'}
+    if (token_df.empty or reference_df.empty
+            or not required.issubset(token_df.columns) or not required.issubset(reference_df.columns)):
+        return token_df.iloc[0:0].assign(
+            match_symbol='', match_name='', symbol_similarity=0.0,
+            name_similarity=0.0, combined_score=0.0, is_match=False
+        )
+    tok_syms, tok_sym_empty = _lowercase_column(token_df['symbol'])
+    tok_names, tok_name_empty = _lowercase_column(token_df['name'])
+    ref_syms, ref_sym_empty = _lowercase_column(reference_df['symbol'])
+    ref_names, ref_name_empty = _lowercase_column(reference_df['name'])
+
+    # A match needs a combined score of at least min_combined, which in turn needs
+    # each field above a floor; pairs below it can never be the matching best ref,
+    # so their DP is cut short (score reported as 0)
+    min_combined = (symbol_threshold * 0.6) + (name_threshold * 0.4)
+    symbol_cutoff = max((min_combined - 0.4) / 0.6, 0)
+    name_cutoff = max((min_combined - 0.6) / 0.4, 0)
+
+    # Full N x M symbol similarity matrix, computed in C across all cores.
+    # With a cutoff, pairs whose length difference alone exceeds the allowed
+    # edit distance are rejected before any DP is run.
+    sym_sim = process.cdist(tok_syms, ref_syms, scorer=Levenshtein.normalized_similarity,
+                            score_cutoff=symbol_cutoff, dtype=np.float64, workers=-1)
+    # An empty symbol/name never contributes to the similarity
+    sym_sim[tok_sym_empty, :] = 0
+    sym_sim[:, ref_sym_empty] = 0
+
+    if symbol_cutoff > 0:
+        # Only pairs whose symbol survived the cutoff can be a match, so the
+        # (longer) names are only compared for those candidates
+        cand_rows, cand_cols = np.nonzero(sym_sim)
+        name_sim = np.zeros_like(sym_sim)
+        name_sim[cand_rows, cand_cols] = process.cpdist(
+            np.asarray(tok_names, dtype=object)[cand_rows].tolist(),
+            np.asarray(ref_names, dtype=object)[cand_cols].tolist(),
+            scorer=Levenshtein.normalized_similarity, score_cutoff=name_cutoff, dtype=np.float64, workers=-1
+        )
+    else:
+        name_sim = process.cdist(tok_names, ref_names, scorer=Levenshtein.normalized_similarity,
+                                 score_cutoff=name_cutoff, dtype=np.float64, workers=-1)
+    name_sim[tok_name_empty, :] = 0
+    name_sim[:, ref_name_empty] = 0
+
+    combined = (sym_sim * 0.6) + (name_sim * 0.4)
+    best_idx = combined.argmax(axis=1)
+    rows = np.arange(len(tok_syms))
+    best_sym_sim = sym_sim[rows, best_idx]
+    best_name_sim = name_sim[rows, best_idx]
+    best_combined = combined[rows, best_idx]
+    # A best combined score of 0 means no reference was similar at all
+    is_match = (best_combined > 0) & (best_sym_sim >= symbol_threshold) & (best_name_sim >= name_threshold)
+
+    # Results keep token_df's index so callers can align matches back to their rows
+    all_results_df = token_df.assign(
+        match_symbol=reference_df['symbol'].to_numpy()[best_idx],
+        match_name=reference_df['name'].to_numpy()[best_idx],
+        symbol_similarity=best_sym_sim,
+        name_similarity=best_name_sim,
+        combined_score=best_combined,
+        is_match=is_match
+    )
+    matched_df = all_results_df[is_match].copy()
     return matched_df
 
 # This file has been deprecated. Use fraud_orchestrator.py for the orchestration logic.
@@ -1,21 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from phishing_detection import check_phishing_indicators
+from phishing_detection import check_phishing_indicators_batch
 from counterfeit_detection import assess_token_counterfeit
 
+# fraud_type values in priority order, and the risk_category each one maps to
+FRAUD_TYPES = np.array(['phishing', 'counterfeit', 'suspicious', 'unknown'], dtype=object)
+RISK_CATEGORIES = np.array(['high risk', 'high risk', 'caution', 'unknown'], dtype=object)
+
+# Below this many tokens, worker start-up costs more than the phishing checks themselves
+PARALLEL_PHISHING_MIN_ROWS = 1000
+
+def phishing_runs_in_process(token_df: pd.DataFrame) -> bool:
+    """True when run_phishing_checks will not start a process pool for this batch."""
+    return len(token_df) < PARALLEL_PHISHING_MIN_ROWS or (os.cpu_count() or 1) == 1
+
+def run_phishing_checks(token_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Run check_phishing_indicators_batch, sharding large batches across CPU cores.
+    Returns the batch results aligned with token_df's index.
+    """
+    workers = os.cpu_count() or 1
+    if phishing_runs_in_process(token_df):
+        return check_phishing_indicators_batch(token_df)
+    # Only name/symbol are needed, so only those are sent to the workers
+    pairs = token_df[['name', 'symbol']]
+    shard_size = -(-len(pairs) // workers)
+    shards = [pairs.iloc[i:i + shard_size] for i in range(0, len(pairs), shard_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return pd.concat(executor.map(check_phishing_indicators_batch, shards))
+
 def assess_token_fraud(token_df: pd.DataFrame) -> pd.DataFrame:
     """
     Orchestrates phishing and counterfeit detection to classify each token as:
     'phishing', 'counterfeit', 'repeat_scam', 'suspicious', or 'legit'.
     Combines results from both detection modules and applies priority logic.
     """
-    # Run phishing detection
-    phishing_results = []
-    for _, row in token_df.iterrows():
-        phishing_results.append(check_phishing_indicators(row))
-    phishing_df = pd.DataFrame(phishing_results)
-    
-    # Run counterfeit detection
-    counterfeit_df = assess_token_counterfeit(token_df)
+    if phishing_runs_in_process(token_df):
+        # Counterfeit detection mostly waits on the Supabase reference fetches (and
+        # rapidfuzz, which releases the GIL), so run it alongside the phishing checks
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            counterfeit_future = executor.submit(assess_token_counterfeit, token_df)
+            phishing_df = run_phishing_checks(token_df)
+            counterfeit_df = counterfeit_future.result()
+    else:
+        # Forking the phishing workers while another thread holds locks (e.g. in the
+        # HTTP client) can deadlock them, so large batches run the stages in turn
+        phishing_df = run_phishing_checks(token_df)
+        counterfeit_df = assess_token_counterfeit(token_df)
     
     # Merge results
     result_df = token_df.copy()
@@ -23,34 +56,25 @@ def assess_token_fraud(token_df: pd.DataFrame) -> pd.DataFrame:
     
     # Add phishing info
     result_df['phishing_indicators'] = phishing_df['indicators']
-    result_df['urls_found'] = phishing_df['details'].apply(lambda d: d.get('urls_found', []))
-    result_df['money_amounts'] = phishing_df['details'].apply(lambda d: d.get('money_amounts', []))
+    result_df['urls_found'] = phishing_df['urls_found']
+    result_df['money_amounts'] = phishing_df['money_amounts']
     # Final fraud_type assignment (priority: phishing > counterfeit > suspicious > unknown)
-    for idx in result_df.index:
-        has_url = bool(result_df.at[idx, 'urls_found'])
-        has_indicator = bool(result_df.at[idx, 'phishing_indicators'])
-        has_amount = bool(result_df.at[idx, 'money_amounts'])
-        is_counterfeit = counterfeit_df.at[idx, 'counterfeit_type'] == 'counterfeit'
-        
-        if has_url and (has_indicator or has_amount):
-            result_df.at[idx, 'fraud_type'] = 'phishing'
-        elif is_counterfeit:
-            result_df.at[idx, 'fraud_type'] = 'counterfeit'
-        elif (has_indicator and has_amount) or has_url or has_indicator or has_amount:
-            result_df.at[idx, 'fraud_type'] = 'suspicious'
-        else:
-            result_df.at[idx, 'fraud_type'] = 'unknown'
-            
+    has_url = result_df['urls_found'].map(bool).to_numpy(dtype=bool)
+    has_indicator = result_df['phishing_indicators'].map(bool).to_numpy(dtype=bool)
+    has_amount = result_df['money_amounts'].map(bool).to_numpy(dtype=bool)
+    is_counterfeit = (counterfeit_df['counterfeit_type'] == 'counterfeit').to_numpy()
+    fraud_code = np.select(
+        [has_url & (has_indicator | has_amount),
+         is_counterfeit,
+         has_indicator | has_amount | has_url],
+        [0, 1, 2],
+        default=3
+    )
+    result_df['fraud_type'] = pd.Categorical.from_codes(fraud_code, categories=FRAUD_TYPES)
     # Set risk_category based on fraud_type
-    def get_risk_category(fraud_type):
-        if fraud_type in ['phishing', 'counterfeit']:
-            return 'high risk'
-        elif fraud_type == 'suspicious':
-            return 'caution'
-        else:  # 'unknown' or any other value
-            return 'unknown'
-    
-    result_df['risk_category'] = result_df['fraud_type'].apply(get_risk_category)
+    result_df['risk_category'] = pd.Categorical(
+        np.take(RISK_CATEGORIES, fraud_code), categories=['high risk', 'caution', 'unknown']
+    )
     return result_df
 
 
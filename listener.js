@@ -49,6 +49,51 @@ const ERC20_ABI = [
   "function totalSupply() view returns (uint256)"
 ];
 
+// --- Fraud Detection Worker ---
+// risk_assessment_bridge.py runs as one long-lived process so its imports and Supabase
+// connection are reused: each request is one JSON line on stdin, and the Python side
+// answers every line with exactly one line on stdout, in order.
+const { spawn } = require('child_process');
+const readline = require('readline');
+
+let riskWorker = null;
+
+function getRiskWorker() {
+  if (riskWorker) return riskWorker;
+  const worker = spawn('python', ['risk_assessment_bridge.py', '--serve']);
+  // Resolvers for requests sent to this worker, oldest first
+  worker.pending = [];
+  readline.createInterface({ input: worker.stdout }).on('line', (line) => {
+    const resolve = worker.pending.shift();
+    if (resolve) resolve(line);
+  });
+  // Log stderr output but don't treat it as an error
+  // Our Python script sends informational logs to stderr
+  worker.stderr.on('data', (data) => {
+    console.log('Python stderr output:', data.toString());
+  });
+  worker.stdin.on('error', (err) => {
+    console.error('Failed to write to risk assessment worker:', err.message);
+  });
+  worker.on('close', (code) => {
+    console.log('Risk assessment worker exited (code:', code, '); it will be restarted on the next token');
+    if (riskWorker === worker) riskWorker = null;
+    // Requests still waiting on this worker will never be answered
+    while (worker.pending.length) worker.pending.shift()(null);
+  });
+  riskWorker = worker;
+  return worker;
+}
+
+// Resolves with the worker's JSON output line for [tokenData], or null if it exited first
+function assessRisk(tokenData) {
+  return new Promise((resolve) => {
+    const worker = getRiskWorker();
+    worker.pending.push(resolve);
+    worker.stdin.write(JSON.stringify([tokenData]) + '\n'); // Wrap in array for Python, one per line
+  });
+}
+
 // Validate network configurations on startup
 async function validateNetworkConfigs() {
   console.log('\n=== Validating Network Configurations ===');
@@ -118,35 +163,16 @@ for (const { name: chainName, alchemy } of alchemyInstances) {
         console.log('New ERC20 token detected:', tokenData);
 
         // --- Fraud Detection Integration ---
-        const { spawn } = require('child_process');
-        const python = spawn('python', ['risk_assessment_bridge.py']);
-        let riskResult = '';
-        let riskError = '';
-        python.stdin.write(JSON.stringify([tokenData])); // Wrap in array for Python
-        python.stdin.end();
-        python.stdout.on('data', (data) => {
-          riskResult += data.toString();
-        });
-        python.stderr.on('data', (data) => {
-          riskError += data.toString();
-        });
-        python.on('close', async (code) => {
-          // Log stderr output but don't treat it as an error
-          // Our Python script now sends informational logs to stderr
-          if (riskError) {
-            console.log('Python stderr output:', riskError);
-          }
-          
+        assessRisk(tokenData).then(async (riskResult) => {
           let riskAssessment = null;
           try {
             // Always try to parse if we have a non-empty result
-            // The actual errors would cause the Python script to exit with non-zero code
+            // A null result means the Python worker exited before answering
             if (riskResult && riskResult.trim()) {
               riskAssessment = JSON.parse(riskResult);
               console.log('Risk Assessment:', riskAssessment);
-            } else if (code !== 0) {
-              // Only skip parsing if the Python script actually failed (non-zero exit code)
-              console.log('Skipping risk assessment parsing due to Python error (exit code:', code, ')');
+            } else if (riskResult === null) {
+              console.log('Skipping risk assessment parsing: the Python worker exited before answering');
             }
           } catch (err) {
             console.error('Failed to parse risk assessment:', err, riskResult);
@@ -168,13 +194,13 @@ for (const { name: chainName, alchemy } of alchemyInstances) {
                 // Using only columns that exist in the table schema
                 risk_category: assessment.risk_category || 'unknown',
                 fraud_type: assessment.fraud_type || 'unknown',
-                // Store all details in the detection_details column
-                detection_details: JSON.stringify({
+                // Store all details in the detection_details (jsonb) column as an object
+                detection_details: {
                   phishing_indicators: assessment.phishing_indicators || [],
                   urls_found: assessment.urls_found || [],
                   money_amounts: assessment.money_amounts || [],
                   details: assessment.details || {}
-                })
+                }
               };
               
               console.log(`Preparing to save with fraud_type=${assessment.fraud_type}, risk_category=${assessment.risk_category}`);
@@ -205,6 +231,9 @@ for (const { name: chainName, alchemy } of alchemyInstances) {
 
 process.on('SIGINT', () => {
   console.log('Shutting down listeners...');
+  if (riskWorker) {
+    riskWorker.stdin.end();
+  }
   for (const { alchemy } of alchemyInstances) {
     if (alchemy.ws && typeof alchemy.ws.close === 'function') {
       alchemy.ws.close();
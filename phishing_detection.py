@@ -1,8 +1,50 @@
-from typing import Dict, Any, List, Union, Optional, Set
+from typing import Dict, Any, List, Union, Optional, Set, Tuple
 import re
 import unicodedata
+from functools import lru_cache
+import pandas as pd
 from urlextract import URLExtract
 import tldextract
+import ahocorasick
+
+PHISHING_INDICATORS = [
+    "immediately", "now", "warning", "last chance", "final", "suspend", "limited time",
+    "deadline", "important", "alert", "urgent", "scan", "qr", "activate", "breach", "security",
+    "giveaway", "airdrop", "free", "claim", "reward", "bonus", "jackpot", "profit", "win", "double",
+    "instant", "rewards", "cashout", "income", "earn", "gift", "collect", "voucher", "code", "loot",
+    "fee", "congratulations", "congratz", "chance", "withdraw", "deposit", "redeem", "get", "promo",
+    "limited", "lend", "swap", "bounty",
+    "url", "login", "login page", "dashboard", "connect", "connect wallet", "verify", "access", "restore",
+    "walletconnect", "web", "web3", "interface", "portal", "site", "website", "app", "application", "official",
+    "exchange", "market", "swap", "pool", "bridge", "stake", "unstake", "farm", "mint", "burn", "token",
+    "contract", "address", "approve", "sign", "signature", "transaction", "transfer", "send", "receive",
+    "claim", "collect", "drop", "minting", "airdrops",
+    "support", "help", "contact", "service", "customer", "team", "admin", "mod", "owner", "official",
+    "announcement", "news", "update", "event", "info", "information"
+]
+
+# All indicators compiled into one automaton so each text is scanned in a single pass
+_INDICATOR_AUTOMATON = ahocorasick.Automaton()
+for _indicator in PHISHING_INDICATORS:
+    _INDICATOR_AUTOMATON.add_word(_indicator, _indicator)
+_INDICATOR_AUTOMATON.make_automaton()
+
+# URLExtract and TLDExtract load their TLD/suffix lists on construction, so build them once
+_URL_EXTRACTOR = URLExtract()
+_TLD_EXTRACTOR = tldextract.TLDExtract()
+_DOMAIN_RE = re.compile(r'\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}\b', re.IGNORECASE)
+
+# Patterns used by preprocess_text and extract_money_amounts, compiled once
+# Shifts Cyrillic А-я (U+0410-U+044F) down by 848 code points; ordinal keys and values
+# are what str.translate consumes directly
+_CYRILLIC_TO_LATIN = {c: c - 848 for c in range(0x0410, 0x0450)}
+# Problematic characters become spaces and whitespace runs collapse, in one pass
+_SPACING_RE = re.compile(r'[\s!\[\]#]+')
+_SPACED_LETTERS_RE = re.compile(r'(?i)\b([a-zA-Z])\s+(?=[a-zA-Z])')
+_INNER_SEPARATORS_RE = re.compile(r'(?<=\w)[^\w.-]+(?=\w)')
+# Leading and trailing junk are stripped in one pass
+_EDGE_JUNK_RE = re.compile(r'^[^\w.-]+|[^a-zA-Z0-9.-]+$')
+_MONEY_RE = re.compile(r'\$\s*\d{1,3}(?:,\d{3})*(?:\.\d{1,2})?', re.IGNORECASE)
 
 def extract_urls_and_domains(row: Dict[str, Any]) -> List[str]:
     """
@@ -12,11 +54,17 @@ def extract_urls_and_domains(row: Dict[str, Any]) -> List[str]:
     Returns:
         List of unique URLs/domains found (lowercase), or [] if none found
     """
-    extractor = URLExtract()
-    domain_pattern = r'\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}\b'
     text = f"{str(row.get('symbol', ''))} {str(row.get('name', ''))}"
-    urls = set(extractor.find_urls(text))
-    domains = set(re.findall(domain_pattern, text, flags=re.IGNORECASE))
+    return _extract_links(text)
+
+def _extract_links(text: str) -> List[str]:
+    """Return unique URLs/domains found in text (lowercase), or [] if none found."""
+    # URLExtract and _DOMAIN_RE only match around a literal '.' (TLDs, IPv4) or the
+    # 'localhost' pseudo-TLD, so most token texts can be ruled out without a scan
+    if '.' not in text and 'localhost' not in text.lower():
+        return []
+    urls = set(_URL_EXTRACTOR.find_urls(text))
+    domains = set(_DOMAIN_RE.findall(text))
     all_links = urls.union(domains)
     return list(map(str.lower, all_links)) if all_links else []
 
@@ -30,14 +78,17 @@ def parse_domains(urls: Union[List[str], str]) -> Union[List[str], str]:
     """
     if not urls or urls == "No URL found":
         return "No URL found"
-    domains = set()
-    for url in urls:
-        ext = tldextract.extract(url)
-        domain = ".".join(part for part in [ext.domain, ext.suffix] if part)
-        if domain:
-            domains.add(domain.lower())
+    domains = {domain for url in urls if (domain := _registered_domain(url))}
     return list(domains) if domains else "No URL found"
 
+# The same scam URLs show up across many tokens, so parsed domains are cached
+@lru_cache(maxsize=100_000)
+def _registered_domain(url: str) -> Optional[str]:
+    """Return the lowercase domain.suffix of a URL, or None if it has neither."""
+    ext = _TLD_EXTRACTOR(url)
+    domain = ".".join(part for part in [ext.domain, ext.suffix] if part)
+    return domain.lower() or None
+
 def preprocess_text(text: str) -> str:
     """
     Normalize and clean text for better phishing detection.
@@ -48,17 +99,26 @@ def preprocess_text(text: str) -> str:
     """
     if not isinstance(text, str):
         return ""
+    # Fast path: ASCII alphanumeric words separated by single spaces, with no
+    # single-letter word before another word, come out of the steps below
+    # unchanged apart from lowercasing
+    if text.isascii():
+        words = text.split(' ')
+        if all(word.isalnum() for word in words) and all(len(word) > 1 for word in words[:-1]):
+            return text.lower()
     text = unicodedata.normalize("NFKC", text)
-    text = re.sub(r'[А-Яа-я]', lambda x: chr(ord(x.group(0)) - 848), text)
+    text = text.translate(_CYRILLIC_TO_LATIN)
     text = text.lower()
-    text = re.sub(r'[!\[\]#]', ' ', text)
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'(?i)\b([a-zA-Z])\s+(?=[a-zA-Z])', r'\1', text)
-    text = re.sub(r'(?<=\w)[^\w.-]+(?=\w)', ' ', text)
-    text = re.sub(r'^[^\w.-]+', '', text)
-    text = re.sub(r'[^a-zA-Z0-9.-]+$', '', text)
+    text = _SPACING_RE.sub(' ', text)
+    text = _SPACED_LETTERS_RE.sub(r'\1', text)
+    text = _INNER_SEPARATORS_RE.sub(' ', text)
+    text = _EDGE_JUNK_RE.sub('', text)
     return text.strip()
 
+def _scan_indicators(cleaned_text: str) -> Set[str]:
+    """Return the phishing indicators contained in already preprocessed text."""
+    return {v for _, v in _INDICATOR_AUTOMATON.iter(cleaned_text)}
+
 def find_phishing_indicators(name: Optional[str], symbol: Optional[str]) -> Union[List[str], str]:
     """
     Find phishing indicators in token name and symbol.
@@ -68,34 +128,13 @@ def find_phishing_indicators(name: Optional[str], symbol: Optional[str]) -> Unio
     Returns:
         List of found phishing indicators or "No Match"
     """
-    phishing_indicators = [
-        "immediately", "now", "warning", "last chance", "final", "suspend", "limited time",
-        "deadline", "important", "alert", "urgent", "scan", "qr", "activate", "breach", "security",
-        "giveaway", "airdrop", "free", "claim", "reward", "bonus", "jackpot", "profit", "win", "double",
-        "instant", "rewards", "cashout", "income", "earn", "gift", "collect", "voucher", "code", "loot",
-        "fee", "congratulations", "congratz", "chance", "withdraw", "deposit", "redeem", "get", "promo",
-        "limited", "lend", "swap", "bounty",
-        "url", "login", "login page", "dashboard", "connect", "connect wallet", "verify", "access", "restore",
-        "walletconnect", "web", "web3", "interface", "portal", "site", "website", "app", "application", "official",
-        "exchange", "market", "swap", "pool", "bridge", "stake", "unstake", "farm", "mint", "burn", "token",
-        "contract", "address", "approve", "sign", "signature", "transaction", "transfer", "send", "receive",
-        "claim", "collect", "drop", "minting", "airdrops",
-        "support", "help", "contact", "service", "customer", "team", "admin", "mod", "owner", "official",
-        "announcement", "news", "update", "event", "info", "information"
-    ]
     found_indicators = set()
     if name:
         cleaned_name = preprocess_text(name)
-        found_indicators.update(
-            indicator for indicator in phishing_indicators 
-            if indicator in cleaned_name
-        )
+        found_indicators.update(_scan_indicators(cleaned_name))
     if symbol:
         cleaned_symbol = preprocess_text(symbol)
-        found_indicators.update(
-            indicator for indicator in phishing_indicators 
-            if indicator in cleaned_symbol
-        )
+        found_indicators.update(_scan_indicators(cleaned_symbol))
     return list(found_indicators) if found_indicators else "No Match"
 
 def extract_money_amounts(name: Optional[str], symbol: Optional[str]) -> Union[List[str], str]:
@@ -108,14 +147,13 @@ def extract_money_amounts(name: Optional[str], symbol: Optional[str]) -> Union[L
         List of found money amounts or "No Match"
     """
     all_matches: List[str] = []
-    money_pattern = re.compile(r'\$\s*\d{1,3}(?:,\d{3})*(?:\.\d{1,2})?', re.IGNORECASE)
     if name:
         text = unicodedata.normalize("NFKC", name)
-        matches = money_pattern.findall(text)
+        matches = _MONEY_RE.findall(text)
         all_matches.extend(match.replace(" ", "") for match in matches)
     if symbol:
         text = unicodedata.normalize("NFKC", symbol)
-        matches = money_pattern.findall(text)
+        matches = _MONEY_RE.findall(text)
         all_matches.extend(match.replace(" ", "") for match in matches)
     return all_matches if all_matches else "No Match"
 
@@ -134,49 +172,99 @@ def check_phishing_indicators(token_data: Dict[str, Any]) -> Dict[str, Any]:
         - indicators: List of found indicators
         - details: Detailed findings from each check
     """
-    result = {
-        'indicators': [],
-        'details': {
-            'urls_found': [],
-            'domains_found': [],
-            'phishing_indicators':  [],
-            'money_amounts': [],
-            'warnings': []
-        }
+    indicators, urls, domains, found, amounts, warnings = _pair_findings(
+        token_data.get('name', ''), token_data.get('symbol', '')
+    )
+    details = {
+        'urls_found': list(urls),
+        'domains_found': list(domains),
+        'phishing_indicators': list(found),
+        'money_amounts': list(amounts),
+        'warnings': list(warnings)
+    }
+    # Only checks that found something are reported
+    return {
+        'indicators': list(indicators),
+        'details': {k: v for k, v in details.items() if v}
     }
-    # 1. Check for URLs in symbol/name
+
+def _normalize_for_money(text: Any) -> str:
+    """NFKC-normalize text for money amount matching; non-strings yield ''."""
+    return unicodedata.normalize("NFKC", text) if isinstance(text, str) else ""
+
+# Copy-cat tokens reuse the same name/symbol, so findings are cached per pair.
+# Values are tuples so cached results cannot be mutated by callers.
+@lru_cache(maxsize=100_000)
+def _phishing_findings(name: Any, symbol: Any) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Run the phishing checks for one name/symbol pair: URLs/domains, phishing
+    terms and money amounts. A failing check is recorded as a warning instead of raising.
+    Returns (indicators, urls_found, domains_found, phishing_indicators, money_amounts, warnings).
+    """
+    urls: List[str] = []
+    domains: List[str] = []
+    found: List[str] = []
+    amounts: List[str] = []
+    warnings: List[str] = []
+    # 1. URLs in symbol/name
     try:
-        urls = extract_urls_and_domains(token_data)
-        if urls and urls != "No URL found":
-            result['details']['urls_found'] = urls
-
-            result['indicators'].append('URLs found in token name/symbol')
-            domains = parse_domains(urls)
-            if domains and domains != "No URL found":
-                result['details']['domains_found'] = domains
+        urls = _extract_links(f"{str(symbol)} {str(name)}")
+        if urls:
+            parsed = parse_domains(urls)
+            if parsed != "No URL found":
+                domains = parsed
     except Exception as e:
-        result['details']['warnings'].append(f'URL extraction failed: {str(e)}')
-    # 2. Check for phishing indicators in name/symbol
+        warnings.append(f'URL extraction failed: {str(e)}')
+    # 2. Phishing indicators in name/symbol
     try:
-        name = token_data.get('name', '')
-        symbol = token_data.get('symbol', '')
-        phishing_indicators = find_phishing_indicators(name, symbol)
-        if phishing_indicators != "No Match":
-            result['details']['phishing_indicators'] = phishing_indicators
-
-            result['indicators'].extend(phishing_indicators)
+        found = list(_scan_indicators(preprocess_text(name)) | _scan_indicators(preprocess_text(symbol)))
     except Exception as e:
-        result['details']['warnings'].append(f'Phishing indicator check failed: {str(e)}')
-    # 3. Check for money amounts in name/symbol
+        warnings.append(f'Phishing indicator check failed: {str(e)}')
+    # 3. Money amounts in name/symbol
     try:
-        money_amounts = extract_money_amounts(name, symbol)
-        if money_amounts != "No Match":
-            result['details']['money_amounts'] = money_amounts
-
-            result['indicators'].append('Money amount found in name/symbol')
+        amounts = [
+            match.replace(" ", "")
+            for text in (name, symbol)
+            for match in _MONEY_RE.findall(_normalize_for_money(text))
+        ]
     except Exception as e:
-        result['details']['warnings'].append(f'Money amount extraction failed: {str(e)}')
-    # 4. Additional checks can be added here
-    result['details'] = {k: v for k, v in result['details'].items() if v}
+        warnings.append(f'Money amount extraction failed: {str(e)}')
+    indicators = (
+        (['URLs found in token name/symbol'] if urls else [])
+        + found
+        + (['Money amount found in name/symbol'] if amounts else [])
+    )
+    return tuple(indicators), tuple(urls), tuple(domains), tuple(found), tuple(amounts), tuple(warnings)
+
+def _pair_findings(name: Any, symbol: Any) -> Tuple[Tuple[str, ...], ...]:
+    """_phishing_findings, bypassing the cache for unhashable values (e.g. lists)."""
+    try:
+        hash((name, symbol))
+    except TypeError:
+        return _phishing_findings.__wrapped__(name, symbol)
+    return _phishing_findings(name, symbol)
 
-    return result
+def check_phishing_indicators_batch(token_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Run the checks from check_phishing_indicators over a whole DataFrame,
+    analysing each distinct name/symbol pair only once.
+    Args:
+        token_df: DataFrame with at least 'name' and 'symbol' columns
+    Returns:
+        DataFrame aligned with token_df's index, with columns:
+        - indicators: List of found indicators (as in check_phishing_indicators)
+        - urls_found: List of URLs/domains found in name/symbol
+        - domains_found: List of normalized domains parsed from urls_found
+        - phishing_indicators: List of phishing terms found in name/symbol
+        - money_amounts: List of money amounts found in name/symbol
+        - warnings: List of checks that failed for the row
+    """
+    findings = [
+        _pair_findings(name, symbol)
+        for name, symbol in zip(token_df['name'], token_df['symbol'])
+    ]
+    columns = ['indicators', 'urls_found', 'domains_found', 'phishing_indicators', 'money_amounts', 'warnings']
+    return pd.DataFrame({
+        column: [list(row[i]) for row in findings]
+        for i, column in enumerate(columns)
+    }, index=token_df.index)
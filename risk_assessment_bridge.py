@@ -1,67 +1,241 @@
+import os
 import sys
-import json
+import time
+import random
+import orjson
+import httpx
+from postgrest import ReturnMethod
+from postgrest.exceptions import APIError
 from fraud_orchestrator import assess_token_fraud
+from counterfeit_detection import get_supabase_client
 import pandas as pd
-import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from concurrent.futures import ThreadPoolExecutor
 
-if __name__ == "__main__":
-    # Read JSON from stdin
-    input_data = sys.stdin.read()
-    tokens = json.loads(input_data)
+# Per-row/per-batch logging to stderr, enabled with BRIDGE_DEBUG=1
+DEBUG = os.getenv("BRIDGE_DEBUG") == "1"
+# Maximum number of rows sent in a single upsert request
+MERGE_BATCH_LIMIT = 100
+# Maximum number of concurrent requests when a batch falls back to per-row upserts
+FALLBACK_UPSERT_WORKERS = 16
+# Retry policy for transient Supabase failures (rate limiting, gateway errors, timeouts)
+UPSERT_MAX_ATTEMPTS = 5
+UPSERT_BACKOFF_BASE = 0.2  # seconds
+UPSERT_BACKOFF_MAX = 5  # seconds
+RETRYABLE_STATUS_CODES = {'429', '500', '502', '503', '504'}
+# PostgREST's own 503/504s (database unreachable, connection pool timeout, schema cache
+# not loaded) come with a JSON body, so their code is one of these instead of the status
+RETRYABLE_POSTGREST_CODES = {'PGRST000', 'PGRST001', 'PGRST002', 'PGRST003'}
+# erc20_tokens columns filled straight from the assessed token rows
+SCHEMA_COLS = [
+    'contract_address', 'blockchain', 'name', 'symbol', 'decimals',
+    'creator_address', 'created_block_timestamp', 'fraud_type', 'risk_category'
+]
+# Schema columns declared NOT NULL in erc20_tokens
+REQUIRED_COLS = [
+    'contract_address', 'blockchain', 'name', 'symbol', 'decimals',
+    'creator_address', 'created_block_timestamp'
+]
+
+def column_values(df, column, default=None):
+    """
+    Return a column as a list of Python objects, or default for every row
+    when the column is missing (mirroring dict.get on a record).
+    """
+    if column in df.columns:
+        return df[column].tolist()
+    return [default] * len(df)
+
+def build_detection_details(result_df):
+    """
+    Build the combined detection details of every row in one pass.
+    Returns plain dicts; detection_details is a jsonb column, so they are sent as
+    part of the request body instead of being serialized to strings first.
+    """
+    return [
+        {
+            'phishing_indicators': phishing_indicators,
+            'urls_found': urls_found,
+            'money_amounts': money_amounts,
+            'details': details,
+            'warnings': warnings
+        }
+        for phishing_indicators, urls_found, money_amounts, details, warnings in zip(
+            column_values(result_df, 'phishing_indicators', []),
+            column_values(result_df, 'urls_found', []),
+            column_values(result_df, 'money_amounts', []),
+            column_values(result_df, 'details', {}),
+            column_values(result_df, 'warnings', []),
+        )
+    ]
+
+def build_upsert_rows(result_df):
+    """
+    Build the erc20_tokens payloads for all assessed token rows,
+    keeping only columns that exist in the table schema.
+    """
+    # Project down to the schema columns once; missing ones are added as nulls
+    narrow = result_df.reindex(columns=SCHEMA_COLS)
+
+    # Coerce typed columns up front so PostgREST doesn't reject rows one by one;
+    # unparseable values become nulls
+    decimals = pd.to_numeric(narrow['decimals'], errors='coerce')
+    narrow['decimals'] = decimals.where(decimals % 1 == 0).astype('Int64')
+    narrow['created_block_timestamp'] = pd.to_datetime(
+        narrow['created_block_timestamp'], errors='coerce', utc=True, format='ISO8601'
+    ).dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    # Rows missing a NOT NULL column would only fail server-side, so drop them once
+    complete = narrow[REQUIRED_COLS].notna().all(axis=1)
+    if not complete.all():
+        print(f"Skipping {int((~complete).sum())} rows with missing or invalid required fields",
+              file=sys.stderr)
+
+    narrow = narrow.astype(object).where(narrow.notna(), None)
+    narrow['detection_details'] = build_detection_details(result_df)
+    narrow = narrow[complete]
+    # One payload per (contract_address, blockchain); the last one is what sequential
+    # upserts would have left behind, and Postgres rejects an ON CONFLICT batch that
+    # touches the same row twice
+    narrow = narrow.drop_duplicates(subset=['contract_address', 'blockchain'], keep='last')
+    return narrow.to_dict(orient='records')
+
+def is_transient_error(error):
+    """True for errors worth retrying: network failures and 429/5xx responses."""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if not isinstance(error, APIError):
+        return False
+    # Error responses without a PostgREST JSON body carry the HTTP status as their code
+    code = str(error.code)
+    return code in RETRYABLE_STATUS_CODES or code in RETRYABLE_POSTGREST_CODES
+
+def execute_with_retry(request):
+    """
+    Run request(), retrying transient failures with exponential backoff and
+    full jitter. Other errors (e.g. validation 4xx) are raised immediately.
+    """
+    for attempt in range(UPSERT_MAX_ATTEMPTS):
+        try:
+            return request()
+        except Exception as e:
+            if attempt == UPSERT_MAX_ATTEMPTS - 1 or not is_transient_error(e):
+                raise
+            delay = random.uniform(0, min(UPSERT_BACKOFF_MAX, UPSERT_BACKOFF_BASE * 2 ** attempt))
+            # Also called from the fallback worker threads, so write each line in one call
+            sys.stderr.write(f"Transient Supabase error ({e}); retrying in {delay:.2f}s\n")
+            time.sleep(delay)
+
+def upsert_row_individually(supabase, upsert_row):
+    """Upsert a single row, logging instead of raising on failure. Returns True on success."""
+    try:
+        execute_with_retry(lambda: supabase.table("erc20_tokens").upsert(
+            upsert_row, on_conflict="contract_address,blockchain", returning=ReturnMethod.minimal
+        ).execute())
+        if DEBUG:
+            # One pre-joined write per line so lines from worker threads don't interleave
+            sys.stderr.write(f"Saved to Supabase with fraud_type={upsert_row['fraud_type']}, "
+                             f"risk_category={upsert_row['risk_category']}\n")
+        return True
+    except Exception as e:
+        message = f"Error saving to Supabase: {e}\n"
+        if DEBUG:
+            message += f"Attempted to save: {upsert_row}\n"
+        sys.stderr.write(message)
+        return False
+
+def upsert_rows(supabase, rows):
+    """
+    Upsert rows into erc20_tokens in chunks of MERGE_BATCH_LIMIT.
+    A chunk rejected for a non-transient reason (e.g. one invalid record) is retried
+    row by row so one bad record doesn't drop the batch.
+    Returns the number of rows that could not be saved.
+    """
+    table = supabase.table("erc20_tokens")
+    n_failed = 0
+    for start in range(0, len(rows), MERGE_BATCH_LIMIT):
+        chunk = rows[start:start + MERGE_BATCH_LIMIT]
+        try:
+            # Use upsert with the correct constraint name. Nothing reads the upserted rows
+            # back, so ask for a minimal response instead of having them re-encoded,
+            # sent and parsed again
+            execute_with_retry(lambda: table.upsert(
+                chunk, on_conflict="contract_address,blockchain", returning=ReturnMethod.minimal
+            ).execute())
+            if DEBUG:
+                print(f"Saved {len(chunk)} rows to Supabase", file=sys.stderr)
+        except Exception as e:
+            if is_transient_error(e):
+                # Retries are used up; splitting the batch into per-row requests would
+                # only put more load on a server that is rate limiting or overloaded
+                print(f"Error saving batch to Supabase: {e}; giving up on {len(chunk)} rows",
+                      file=sys.stderr)
+                n_failed += len(chunk)
+                continue
+            print(f"Error saving batch to Supabase: {e}; retrying row by row", file=sys.stderr)
+            # Per-row requests are latency-bound and independent, so overlap them
+            with ThreadPoolExecutor(max_workers=FALLBACK_UPSERT_WORKERS) as executor:
+                saved = list(executor.map(lambda upsert_row: upsert_row_individually(supabase, upsert_row), chunk))
+            n_failed += sum(not ok for ok in saved)
+    # Use stderr for logs to avoid interfering with JSON output
+    print(f"Upserted {len(rows)} rows to Supabase ({n_failed} failures)", file=sys.stderr)
+    return n_failed
+
+def write_records(result_df, out):
+    """
+    Write result_df to out as a JSON array of records, encoding one row at a
+    time so the full output is never held in memory as a single string.
+    """
+    columns = list(result_df.columns)
+    out.write(b"[")
+    for i, values in enumerate(result_df.itertuples(index=False, name=None)):
+        if i:
+            out.write(b",")
+        out.write(orjson.dumps(dict(zip(columns, values)), option=orjson.OPT_SERIALIZE_NUMPY))
+    out.write(b"]\n")
+
+def handle(tokens, out):
+    """
+    Assess one batch of tokens, upsert the results into Supabase and write them
+    to out as a single-line JSON array.
+    """
     token_df = pd.DataFrame(tokens)
     result_df = assess_token_fraud(token_df)
+    # Ensure fraud_type and risk_category are never null
+    result_df['fraud_type'] = result_df['fraud_type'].fillna('unknown')
+    result_df['risk_category'] = result_df['risk_category'].fillna('unknown')
 
-    # Store results in Supabase table 'erc20_tokens'
-    load_dotenv()
-    SUPABASE_URL = os.getenv("SUPABASE_URL")
-    SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-
-    # Upsert each row (assuming 'contract_address' is unique key; change if needed)
-    for row in result_df.to_dict(orient='records'):
-        # Combine all detection details into a single dict
-        detection_details = {
-            'phishing_indicators': row.get('phishing_indicators', []),
-            'urls_found': row.get('urls_found', []),
-            'money_amounts': row.get('money_amounts', []),
-            'details': row.get('details', {}),
-            'warnings': row.get('warnings', [])
-        }
-        
-        # Ensure fraud_type is not None
-        fraud_type = row.get('fraud_type')
-        if fraud_type is None:
-            fraud_type = 'unknown'
-            
-        # Ensure risk_category is not None
-        risk_category = row.get('risk_category')
-        if risk_category is None:
-            risk_category = 'unknown'
-        
-        # Prepare row for insert: keep only columns that exist in the table schema
-        upsert_row = {
-            'contract_address': row.get('contract_address'),
-            'blockchain': row.get('blockchain'),
-            'name': row.get('name'),
-            'symbol': row.get('symbol'),
-            'decimals': row.get('decimals'),
-            'creator_address': row.get('creator_address'),
-            'created_block_timestamp': row.get('created_block_timestamp'),
-            'fraud_type': fraud_type,
-            'risk_category': risk_category,
-            'detection_details': json.dumps(detection_details)  # Explicitly convert to JSON string
-        }
-        
+    # Store results in Supabase table 'erc20_tokens', reusing the client (and its
+    # keep-alive connection pool) that already fetched the reference tables
+    supabase = get_supabase_client()
+
+    # Upsert all rows in batches (contract_address, blockchain is the unique key)
+    all_rows = build_upsert_rows(result_df)
+    upsert_rows(supabase, all_rows)
+    del all_rows
+
+    write_records(result_df, out)
+
+def serve(stdin, out):
+    """
+    Run as a long-lived worker: each input line is a JSON array of tokens and is
+    answered with exactly one output line, so the imports, the Supabase client
+    and its connections are reused across events.
+    """
+    for line in stdin:
+        if not line.strip():
+            continue
         try:
-            # Use upsert with the correct constraint name
-            response = supabase.table("erc20_tokens").upsert(upsert_row, on_conflict="contract_address,blockchain").execute()
-            # Use stderr for logs to avoid interfering with JSON output
-            print(f"Saved to Supabase with fraud_type={fraud_type}, risk_category={risk_category}", file=sys.stderr)
+            handle(orjson.loads(line), out)
         except Exception as e:
-            print(f"Error saving to Supabase: {e}", file=sys.stderr)
-            print(f"Attempted to save: {upsert_row}", file=sys.stderr)
-            # Continue with next token even if this one fails
+            # Still answer the request so the caller's responses stay in order
+            print(f"Error assessing tokens: {e}", file=sys.stderr)
+            out.write(b"[]\n")
+        out.flush()
 
-    print(result_df.to_json(orient='records'))
+if __name__ == "__main__":
+    if "--serve" in sys.argv[1:]:
+        # NDJSON in, NDJSON out until stdin is closed
+        serve(sys.stdin.buffer, sys.stdout.buffer)
+    else:
+        # Read JSON from stdin (as bytes, which orjson parses directly)
+        handle(orjson.loads(sys.stdin.buffer.read()), sys.stdout.buffer)